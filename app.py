@@ -6,13 +6,28 @@ VE-System API Server v4
 """
 
 import os
+import queue
 import sqlite3
+import gzip
 import json
+import atexit
+import random
+import re
 import hashlib
+import hmac
 import secrets
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from functools import wraps
-from flask import Flask, jsonify, request, g
+from itertools import repeat
+import orjson
+from flask import Flask, Response, request, g
+from flask.json.provider import JSONProvider
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
@@ -20,32 +35,498 @@ app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-i
 # 資料庫目錄
 DB_DIR = os.environ.get('DATABASE_DIR', './data')
 USER_DB = os.path.join(DB_DIR, 'users.db')
+DATABASES = ['meta', 've', 'trade', 'education', 'business', 'clarity', 'corpus', 'taoist', 'work']
+DB_PATHS = {db_name: os.path.join(DB_DIR, f'{db_name}.db') for db_name in DATABASES}
+_ALLOWED_DBS = frozenset(DATABASES)  # 可經由 /api/v1/db/ 查詢的資料庫，users.db 不在其中
+
+# ============ 回應工具 ============
+def _json_default(obj):
+    # sqlite3.Row 直接交給 orjson，於序列化時才展開，不必先逐列建立 dict
+    if isinstance(obj, sqlite3.Row):
+        return dict(obj)
+    raise TypeError
+
+def json_response(obj, status=200):
+    """以 orjson 序列化的 JSON 回應，可直接傳入 sqlite3.Row"""
+    return Response(orjson.dumps(obj, default=_json_default), status=status, mimetype='application/json')
+
+def _error_body(message, code=None):
+    body = {'error': message}
+    if code:
+        body['code'] = code
+    return orjson.dumps(body)
+
+# 固定錯誤訊息的 JSON bytes 於載入時預先序列化；含使用者輸入的動態訊息每次現做，不進快取
+_ERROR_BODIES = {key: _error_body(*key) for key in (
+    ('需要登入', 'AUTH_REQUIRED'),
+    ('令牌無效或已過期', 'INVALID_TOKEN'),
+    ('用戶名至少3個字元', 'INVALID_USERNAME'),
+    ('密碼至少6個字元', 'INVALID_PASSWORD'),
+    ('用戶名已被使用', 'USERNAME_EXISTS'),
+    ('Email已被使用', 'EMAIL_EXISTS'),
+    ('請輸入用戶名和密碼', 'MISSING_CREDENTIALS'),
+    ('用戶名或密碼錯誤', 'INVALID_CREDENTIALS'),
+    ('需要管理權限', 'ADMIN_REQUIRED'),
+    ('沒有可更新的欄位', None),
+    ('缺少 question_id', None),
+    ('缺少 scenario_id', None),
+    ('教育資料庫不存在', None),
+    ('缺少必要參數', None),
+    ('參數格式錯誤', None),
+    ('題目不存在', None),
+)}
+
+def error_response(message, status, code=None):
+    """錯誤回應：固定訊息使用預先序列化的 bytes (Response 仍每次新建，after_request 會修改標頭)"""
+    body = _ERROR_BODIES.get((message, code))
+    if body is None:
+        body = _error_body(message, code)
+    return Response(body, status=status, mimetype='application/json')
+
+class ORJSONProvider(JSONProvider):
+    """讓 Flask 的 request.get_json() 與 jsonify 也走 orjson"""
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_json_default, option=orjson.OPT_NON_STR_KEYS).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+app.json = ORJSONProvider(app)
+
+# 秒級快取的 ISO 時間 (時間戳, str, bytes)，高頻端點不必每次建立 datetime 並格式化
+_TS_CACHE = (0, '', b'')
+
+def _current_ts():
+    global _TS_CACHE
+    now = int(time.time())
+    if now != _TS_CACHE[0]:
+        ts = datetime.fromtimestamp(now).isoformat()
+        _TS_CACHE = (now, ts, ts.encode())
+    return _TS_CACHE
+
+def iso_now():
+    return _current_ts()[1]
+
+def iso_now_bytes():
+    return _current_ts()[2]
+
+def request_now():
+    """本次請求的目前時間，同一請求內的多筆寫入共用同一個時間點"""
+    now = g.get('now')
+    if now is None:
+        now = g.now = datetime.now()
+    return now
+
+MAX_ROWS = 500  # 單次回傳筆數上限
+
+def get_limit(default):
+    """讀取 limit 查詢參數，並限制在 0..MAX_ROWS 之間"""
+    return min(max(request.args.get('limit', default, type=int), 0), MAX_ROWS)
+
+def not_modified(etag):
+    """用戶端 If-None-Match 與 etag 相符時回傳 304 回應，否則回傳 None"""
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+    return None
+
+# 唯讀端點的回應快取：(路徑, 查詢字串) -> (到期時間, body, gzip body, etag)，LRU 淘汰
+# 夠大的 body 於寫入快取時一併壓縮，命中時不必每次重新 gzip
+_RESPONSE_CACHE: OrderedDict[tuple[str, bytes], tuple[float, bytes, bytes | None, str | None]] = OrderedDict()
+_RESPONSE_CACHE_LOCK = threading.Lock()
+RESPONSE_CACHE_SIZE = 256
+
+def _use_gzip_variant(response, gz):
+    """回應有預先壓縮的版本時，用戶端接受 gzip 則改送壓縮後的 body"""
+    response.vary.add('Accept-Encoding')
+    if request.accept_encodings['gzip']:
+        response.set_data(gz)
+        response.headers['Content-Encoding'] = 'gzip'
+
+def cached_response(ttl, client_cache=False):
+    """快取 200 JSON 回應序列化後的 bytes，命中時不執行 SQL 也不重新序列化
+
+    client_cache 為 True 時加上 Cache-Control，允許用戶端沿用與伺服器快取相同的秒數。
+    """
+    cache_control = f'max-age={ttl}, must-revalidate' if client_cache else None
+    
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            key = (request.path, request.query_string)
+            now = time.monotonic()
+            with _RESPONSE_CACHE_LOCK:
+                hit = _RESPONSE_CACHE.get(key)
+                if hit and hit[0] > now:
+                    _RESPONSE_CACHE.move_to_end(key)
+                else:
+                    hit = None
+            
+            if hit is None:
+                response = f(*args, **kwargs)
+                if response.status_code not in (200, 304):
+                    return response
+                if cache_control:
+                    response.headers['Cache-Control'] = cache_control
+                if response.status_code == 304:
+                    return response
+                body = response.get_data()
+                gz = gzip.compress(body, COMPRESS_LEVEL) if len(body) >= COMPRESS_MIN_SIZE else None
+                hit = (now + ttl, body, gz, response.get_etag()[0])
+                with _RESPONSE_CACHE_LOCK:
+                    _RESPONSE_CACHE[key] = hit
+                    _RESPONSE_CACHE.move_to_end(key)
+                    if len(_RESPONSE_CACHE) > RESPONSE_CACHE_SIZE:
+                        _RESPONSE_CACHE.popitem(last=False)
+                if gz is not None:
+                    _use_gzip_variant(response, gz)
+                return response
+            
+            _, body, gz, etag = hit
+            response = not_modified(etag) if etag else None
+            if response is None:
+                response = Response(body, mimetype='application/json')
+                if etag:
+                    response.set_etag(etag, weak=True)
+                if gz is not None:
+                    _use_gzip_variant(response, gz)
+            if cache_control:
+                response.headers['Cache-Control'] = cache_control
+            return response
+        return decorated
+    return decorator
 
 # ============ CORS 設定 ============
+CORS_HEADERS = (
+    ('Access-Control-Allow-Origin', '*'),
+    ('Access-Control-Allow-Headers', 'Content-Type,Authorization,X-Token'),
+    ('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS'),
+)
+PREFLIGHT_MAX_AGE = '86400'  # 瀏覽器快取預檢結果的秒數
+
+@app.before_request
+def cors_preflight():
+    # 預檢請求不進入路由與認證，直接回 204；CORS 標頭由 after_request 附加
+    if request.method == 'OPTIONS':
+        return Response(status=204, headers={'Access-Control-Max-Age': PREFLIGHT_MAX_AGE})
+
 @app.after_request
 def after_request(response):
-    response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,X-Token')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
+    if getattr(response, 'skip_cors', False):
+        return response
+    # 標頭皆為固定常數，一次附加
+    response.headers.extend(CORS_HEADERS)
+    return response
+
+# ============ 回應壓縮 ============
+COMPRESS_MIN_SIZE = 500  # bytes，小於此大小壓縮不划算
+COMPRESS_LEVEL = 4
+
+@app.after_request
+def compress_response(response):
+    if (response.status_code != 200 or response.direct_passthrough
+            or response.mimetype != 'application/json'
+            or 'Content-Encoding' in response.headers
+            or not request.accept_encodings['gzip']):
+        return response
+    
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+    response.set_data(gzip.compress(body, COMPRESS_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
     return response
 
 # ============ 資料庫工具 ============
-def get_db(db_name):
-    db_path = os.path.join(DB_DIR, f'{db_name}.db')
-    if not os.path.exists(db_path):
+# 唯讀資料庫連線池：每個資料庫一個佇列，連線借出後歸還，整個 worker 生命週期重複使用
+# 每個資料庫保留的閒置連線上限 (DB_POOL_SIZE)；gunicorn.conf.py 的每個 worker 執行緒數預設與此相同，
+# 讓所有執行緒同時查詢時也不必臨時建立連線；超出的連線用完即關閉
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '16'))
+_POOLS: dict[str, queue.Queue] = {db_name: queue.Queue(maxsize=POOL_SIZE) for db_name in DATABASES}  # (連線, 開啟時 mtime)
+
+READONLY_PRAGMAS = '''
+    PRAGMA query_only=1;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA cache_size=-131072;
+'''
+READONLY_MMAP_SIZE = 1073741824
+STATEMENT_CACHE_SIZE = 1024  # 每條連線保留的已編譯 SQL 數量
+
+def _enable_mmap(conn, size):
+    """開啟 mmap 讀取；不支援 mmap 的平台維持一般 I/O"""
+    try:
+        conn.execute(f'PRAGMA mmap_size={int(size)}')
+    except sqlite3.DatabaseError:
+        pass
+
+# 資料庫檔案在部署後不會變動，啟動時讀取一次存在與否及 mtime 即可，請求中不再呼叫 os.stat；
+# 替換 .db 檔案後須重新啟動，或呼叫 DELETE /api/v1/admin/schema-cache 重新讀取並清除所有快取
+_DB_EXISTS: dict[str, bool] = {}
+_DB_MTIMES: dict[str, int] = {}
+
+def refresh_db_files():
+    for db_name, path in DB_PATHS.items():
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            _DB_EXISTS[db_name], _DB_MTIMES[db_name] = False, 0
+        else:
+            _DB_EXISTS[db_name], _DB_MTIMES[db_name] = True, mtime
+
+refresh_db_files()
+
+def _connect_readonly(db_name):
+    try:
+        conn = sqlite3.connect(f'file:{DB_PATHS[db_name]}?mode=ro&immutable=1', uri=True,
+                               check_same_thread=False, isolation_level=None,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+    except sqlite3.OperationalError:
         return None
-    conn = sqlite3.connect(db_path)
     conn.row_factory = sqlite3.Row
+    conn.executescript(READONLY_PRAGMAS)
+    _enable_mmap(conn, READONLY_MMAP_SIZE)
     return conn
 
-def get_user_db():
-    conn = sqlite3.connect(USER_DB)
+@contextmanager
+def get_db(db_name):
+    """自連線池借出唯讀連線，離開 with 區塊時歸還；資料庫不存在時為 None
+
+    連線以 immutable=1 開啟，SQLite 不會察覺檔案被替換；池中連線記錄開啟時的檔案 mtime，
+    與 refresh_db_files() 最近讀取的 mtime 不符的連線直接關閉，改開新連線。
+    """
+    if not _DB_EXISTS.get(db_name):
+        yield None
+        return
+    
+    pool = _POOLS[db_name]
+    mtime = db_mtime(db_name)
+    conn = None
+    while conn is None:
+        try:
+            conn, opened_mtime = pool.get_nowait()
+        except queue.Empty:
+            conn = _connect_readonly(db_name)
+            break
+        if opened_mtime != mtime:
+            conn.close()
+            conn = None
+    try:
+        yield conn
+    finally:
+        if conn is not None:
+            try:
+                pool.put_nowait((conn, mtime))
+            except queue.Full:
+                conn.close()
+
+def db_mtime(db_name):
+    """啟動 (或清除快取) 時讀取的資料庫檔案 mtime (ns)，檔案不存在時為 0"""
+    return _DB_MTIMES.get(db_name, 0)
+
+def db_files_etag(db_names):
+    """以資料庫檔案的 mtime 產生 ETag，不必開啟資料庫"""
+    return hashlib.sha1(repr([db_mtime(db_name) for db_name in db_names]).encode()).hexdigest()[:16]
+
+def warm_db_pool():
+    """啟動時開啟各資料庫並讀取 sqlite_master，預熱 mmap 區域並建立資料表白名單"""
+    for db_name in DATABASES:
+        with get_db(db_name) as conn:
+            if conn:
+                conn.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+                get_tables(db_name, conn)
+
+@atexit.register
+def close_db_pool():
+    """關閉連線池中所有連線"""
+    for pool in _POOLS.values():
+        while True:
+            try:
+                pool.get_nowait()[0].close()
+            except queue.Empty:
+                break
+
+# 結構快取：資料表與欄位在執行期間幾乎不會變動，僅由管理 API 手動清除
+# 資料表清單同時保存有序清單 (回傳用) 與 frozenset (驗證用)
+_TABLES_CACHE: dict[str, tuple[list[str], frozenset[str]]] = {}
+_COLS_CACHE: dict[tuple[str, str], tuple[str, ...]] = {}
+_COUNT_CACHE: dict[str, tuple[int, dict[str, int]]] = {}  # db -> (檔案 mtime, 各表筆數)
+COUNT_BATCH = 200  # 每個 UNION ALL 的資料表數，低於 SQLite 複合查詢上限 500
+
+def _load_tables(db_name, conn):
+    entry = _TABLES_CACHE.get(db_name)
+    if entry is None:
+        rows = conn.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name").fetchall()
+        tables = [row[0] for row in rows]
+        entry = _TABLES_CACHE[db_name] = (tables, frozenset(tables))
+    return entry
+
+def get_tables(db_name, conn):
+    """取得資料表清單 (快取)"""
+    return _load_tables(db_name, conn)[0]
+
+def has_table(db_name, table_name, conn):
+    """資料表是否存在 (快取)，通過驗證的名稱才可拼入 SQL"""
+    return table_name in _load_tables(db_name, conn)[1]
+
+def get_columns(db_name, table_name, conn):
+    """取得資料表欄位 (快取)，table_name 須先經 has_table 驗證
+
+    欄位名稱經 sys.intern，各請求建立 dict 時共用同一批字串與其雜湊值。
+    """
+    key = (db_name, table_name)
+    columns = _COLS_CACHE.get(key)
+    if columns is None:
+        rows = conn.execute(f'PRAGMA table_info("{table_name}")').fetchall()
+        columns = _COLS_CACHE[key] = tuple(sys.intern(row[1]) for row in rows)
+    return columns
+
+def get_table_counts(db_name, conn):
+    """取得各資料表筆數 (資料庫檔案未變動前沿用快取)，無法計數的資料表為 -1
+
+    以單一 UNION ALL 查詢一次取得整批資料表的 COUNT(*)。
+    """
+    mtime = db_mtime(db_name)
+    cached = _COUNT_CACHE.get(db_name)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    
+    tables = get_tables(db_name, conn)
+    counts = {}
+    for i in range(0, len(tables), COUNT_BATCH):
+        batch = tables[i:i + COUNT_BATCH]
+        sql = ' UNION ALL '.join(f'SELECT ?, COUNT(*) FROM "{table}"' for table in batch)
+        try:
+            counts.update(conn.execute(sql, batch).fetchall())
+        except sqlite3.Error:
+            # 整批失敗時 (例如缺少虛擬表模組) 改為逐表計數
+            for table in batch:
+                try:
+                    counts[table] = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+                except sqlite3.Error:
+                    counts[table] = -1
+    
+    _COUNT_CACHE[db_name] = (mtime, counts)
+    return counts
+
+def rows_to_dicts(columns, rows):
+    """將資料列轉為 dict，全程在 C 層級的 map/zip 中完成，避免逐列 Python 迴圈"""
+    return map(dict, map(zip, repeat(columns), rows))
+
+# 熱門查詢的 SQL 常數：字串於載入時建立一次，每次請求以相同字串命中連線的 statement 快取
+CHECK_ANSWER_SQL = 'SELECT answer, explanation, subject_id FROM exam_questions WHERE question_id = ?'
+# 題號 -> (答案, 解析, 科目)：題庫唯讀，熱門題目對答案時不必再查詢；不存在的題號不快取
+_ANSWER_CACHE: dict[str, tuple[str, str, str]] = {}
+ANSWER_CACHE_SIZE = 16384
+_PAGE_SQL: dict[str, str] = {}
+
+def page_sql(table_name):
+    """取得分頁查詢 SQL (快取)，table_name 須先經 has_table 驗證"""
+    sql = _PAGE_SQL.get(table_name)
+    if sql is None:
+        sql = _PAGE_SQL[table_name] = f'SELECT * FROM "{table_name}" LIMIT ? OFFSET ?'
+    return sql
+
+# 有效選擇題池：題庫唯讀，首次抽題時一次載入並解析選項，之後抽題只在記憶體內取樣，不查詢 SQLite
+_QUESTION_POOL: list[dict] | None = None
+_QUESTION_INDEX: dict[str, list[int]] = {}  # 科目關鍵字 -> 題池中的位置
+QUESTION_INDEX_MAX_KEYS = 256
+
+# 有效選擇題：options 須為至少兩個元素的 JSON 陣列，由 JSON1 在 SQLite 內過濾
+QUESTION_FILTER = ' WHERE json_valid(options) AND json_array_length(options) >= 2'
+
+def load_question_pool(conn):
+    """載入全部有效選擇題 (選項解析為 tuple) 作為題池，並清空科目索引"""
+    global _QUESTION_POOL
+    rows = conn.execute('SELECT * FROM exam_questions' + QUESTION_FILTER + ' ORDER BY rowid').fetchall()
+    pool = list(rows_to_dicts(get_columns('education', 'exam_questions', conn), rows))
+    for q in pool:
+        q['options'] = tuple(orjson.loads(q['options']))
+    _QUESTION_INDEX.clear()
+    _QUESTION_POOL = pool
+    return pool
+
+def question_indices(pool, subject):
+    """取得科目關鍵字符合的題池位置 (快取)，比照 SQL LIKE 不分 ASCII 大小寫；subject 為空字串表示全部科目"""
+    indices = _QUESTION_INDEX.get(subject)
+    if indices is None:
+        keyword = subject.lower()
+        indices = [i for i, q in enumerate(pool) if keyword in (q['subject_id'] or '').lower()]
+        if len(_QUESTION_INDEX) >= QUESTION_INDEX_MAX_KEYS:
+            _QUESTION_INDEX.clear()
+        _QUESTION_INDEX[subject] = indices
+    return indices
+
+def clear_schema_cache():
+    """重新讀取資料庫檔案狀態並清除所有衍生快取；池中舊檔案的連線於下次借出時關閉"""
+    global _QUESTION_POOL
+    refresh_db_files()
+    _TABLES_CACHE.clear()
+    _COLS_CACHE.clear()
+    _COUNT_CACHE.clear()
+    _QUESTION_POOL = None
+    _QUESTION_INDEX.clear()
+    _ANSWER_CACHE.clear()
+    with _RESPONSE_CACHE_LOCK:
+        _RESPONSE_CACHE.clear()
+
+# 用戶資料庫為唯一可寫入的資料庫：WAL 讓讀取不被寫入阻擋，synchronous=NORMAL 省去每次提交的 fsync
+USER_DB_PRAGMAS = '''
+    PRAGMA foreign_keys=ON;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA cache_size=-65536;
+'''
+USER_DB_MMAP_SIZE = 268435456
+
+# 用戶資料庫連線池：連線長駐讓頁面快取保持熱度，與唯讀資料庫共用 POOL_SIZE
+_USER_POOL: queue.Queue = queue.Queue(maxsize=POOL_SIZE)
+
+def _connect_user_db():
+    conn = sqlite3.connect(USER_DB, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
     conn.row_factory = sqlite3.Row
+    conn.executescript(USER_DB_PRAGMAS)
+    _enable_mmap(conn, USER_DB_MMAP_SIZE)
     return conn
 
+@contextmanager
+def user_db():
+    """自連線池借出用戶資料庫連線；區塊正常結束 (含提前 return) 時提交，發生例外時回滾"""
+    try:
+        conn = _USER_POOL.get_nowait()
+    except queue.Empty:
+        conn = _connect_user_db()
+    try:
+        yield conn
+        if conn.in_transaction:
+            conn.commit()
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            _USER_POOL.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+@atexit.register
+def close_user_db_pool():
+    while True:
+        try:
+            _USER_POOL.get_nowait().close()
+        except queue.Empty:
+            break
+
+# 用戶資料庫結構版本，新增資料表、欄位或索引時遞增
+SCHEMA_VERSION = 1
+
 def init_user_db():
-    """初始化用戶資料庫"""
-    conn = get_user_db()
+    """初始化用戶資料庫 (PRAGMA user_version 已達 SCHEMA_VERSION 時略過所有 DDL)"""
+    conn = _connect_user_db()
+    if conn.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+        conn.close()
+        return
+    conn.execute('PRAGMA journal_mode=WAL')  # 寫入資料庫檔案，之後的連線沿用
     cur = conn.cursor()
     
     # 用戶表
@@ -170,11 +651,52 @@ def init_user_db():
         )
     ''')
     
+    # UNIQUE(user_id, subject, concept_id) 遇到 NULL 的 concept_id 不會衝突，科目層級進度每次答題都新增一列；
+    # 合併既有重複列後，以部分唯一索引保證每個 (用戶, 科目) 只有一列。
+    # 多個 worker 會同時執行初始化：檢查、合併與建立索引須在同一個寫入交易內完成 (不可用 executescript，它會逐句自動提交)
+    cur.execute('BEGIN IMMEDIATE')
+    if cur.execute('''
+        SELECT 1 FROM learning_progress WHERE concept_id IS NULL
+        GROUP BY user_id, subject HAVING COUNT(*) > 1 LIMIT 1
+    ''').fetchone():
+        cur.execute('''
+            CREATE TEMP TABLE lp_merged AS
+                SELECT user_id, subject, SUM(attempts) AS attempts, SUM(correct_count) AS correct_count,
+                       MAX(last_studied) AS last_studied
+                FROM learning_progress WHERE concept_id IS NULL
+                GROUP BY user_id, subject
+        ''')
+        cur.execute('DELETE FROM learning_progress WHERE concept_id IS NULL')
+        cur.execute('''
+            INSERT INTO learning_progress (user_id, subject, attempts, correct_count, last_studied, mastery_level)
+                SELECT user_id, subject, attempts, correct_count, last_studied,
+                       correct_count * 100.0 / MAX(attempts, 1)
+                FROM lp_merged
+        ''')
+        cur.execute('DROP TABLE lp_merged')
+    cur.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_lp_user_subject ON learning_progress(user_id, subject)
+            WHERE concept_id IS NULL
+    ''')
     conn.commit()
+    
+    # 熱門查詢的索引 (tokens、daily_stats、game_progress 的查詢已由 UNIQUE 約束的索引涵蓋)
+    cur.executescript('''
+        CREATE INDEX IF NOT EXISTS idx_ah_user_answered ON answer_history(user_id, answered_at DESC);
+        CREATE INDEX IF NOT EXISTS idx_ah_user_subject_answered ON answer_history(user_id, subject, answered_at DESC);
+        CREATE INDEX IF NOT EXISTS idx_ah_user_correct ON answer_history(user_id, is_correct);
+        CREATE INDEX IF NOT EXISTS idx_lp_user_last_studied ON learning_progress(user_id, last_studied);
+        CREATE INDEX IF NOT EXISTS idx_users_exp ON users(exp DESC);
+        ANALYZE;
+    ''')
+    
+    conn.commit()
+    conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
     conn.close()
 
 # 初始化
 init_user_db()
+warm_db_pool()
 
 # ============ 密碼工具 ============
 def hash_password(password):
@@ -185,115 +707,160 @@ def hash_password(password):
 def verify_password(password, password_hash):
     try:
         salt, hash_value = password_hash.split('$')
-        hash_obj = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), 100000)
-        return hash_obj.hex() == hash_value
-    except:
+    except (ValueError, AttributeError):
         return False
+    hash_obj = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), 100000)
+    return hmac.compare_digest(hash_obj.hex(), hash_value)
 
 def generate_token():
     return secrets.token_urlsafe(32)
 
 # ============ 認證裝飾器 ============
+# 令牌驗證快取：token -> (快取到期, 令牌到期, user_id)
+# 只快取不會變動的令牌歸屬，用戶資料 (exp、gold 等) 一律由各端點即時查詢。
+# 各 gunicorn worker 各自快取，登出後其他 worker 最多在 AUTH_CACHE_TTL 秒內仍接受該令牌
+_AUTH_CACHE: dict[str, tuple[float, str, int]] = {}
+_AUTH_CACHE_LOCK = threading.Lock()
+AUTH_CACHE_TTL = 5
+AUTH_CACHE_SIZE = 4096
+
+_USER_VERSIONS: dict[int, int] = {}  # 用戶答題記錄變動時遞增，使該用戶的學習分析快取失效
+
+def invalidate_user_cache(user_id):
+    with _AUTH_CACHE_LOCK:
+        _USER_VERSIONS[user_id] = _USER_VERSIONS.get(user_id, 0) + 1
+
+def forget_token(token):
+    with _AUTH_CACHE_LOCK:
+        _AUTH_CACHE.pop(token, None)
+
+def lookup_token(token):
+    """驗證令牌並回傳 user_id (快取 AUTH_CACHE_TTL 秒)，無效時回傳 None"""
+    now = time.monotonic()
+    hit = _AUTH_CACHE.get(token)
+    if hit:
+        deadline, expires_at, user_id = hit
+        if deadline > now and expires_at > iso_now():
+            return user_id
+    
+    with user_db() as conn:
+        row = conn.execute('SELECT user_id, expires_at FROM tokens WHERE token = ? AND expires_at > ?',
+                           (token, iso_now())).fetchone()
+    if not row:
+        return None
+    
+    user_id, expires_at = row
+    with _AUTH_CACHE_LOCK:
+        if len(_AUTH_CACHE) >= AUTH_CACHE_SIZE:
+            _AUTH_CACHE.clear()
+        _AUTH_CACHE[token] = (now + AUTH_CACHE_TTL, expires_at, user_id)
+    return user_id
+
+def extract_token():
+    """自 X-Token 或 Authorization: Bearer 標頭取出令牌，皆無時回傳 None"""
+    token = request.headers.get('X-Token')
+    if token:
+        return token
+    auth = request.headers.get('Authorization')
+    if auth and auth.startswith('Bearer '):
+        return auth[7:]
+    return None
+
 def require_auth(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = request.headers.get('X-Token') or request.headers.get('Authorization', '').replace('Bearer ', '')
+        token = extract_token()
         if not token:
-            return jsonify({'error': '需要登入', 'code': 'AUTH_REQUIRED'}), 401
+            return error_response('需要登入', 401, 'AUTH_REQUIRED')
         
-        conn = get_user_db()
-        cur = conn.cursor()
-        cur.execute('''
-            SELECT t.user_id, u.* FROM tokens t
-            JOIN users u ON t.user_id = u.id
-            WHERE t.token = ? AND t.expires_at > ?
-        ''', (token, datetime.now().isoformat()))
-        row = cur.fetchone()
-        conn.close()
+        user_id = lookup_token(token)
+        if not user_id:
+            return error_response('令牌無效或已過期', 401, 'INVALID_TOKEN')
         
-        if not row:
-            return jsonify({'error': '令牌無效或已過期', 'code': 'INVALID_TOKEN'}), 401
-        
-        g.user = dict(row)
-        g.user_id = row['id']
+        g.token = token
+        g.user_id = user_id
         return f(*args, **kwargs)
     return decorated
 
 def optional_auth(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = request.headers.get('X-Token') or request.headers.get('Authorization', '').replace('Bearer ', '')
-        g.user = None
-        g.user_id = None
-        
-        if token:
-            conn = get_user_db()
-            cur = conn.cursor()
-            cur.execute('''
-                SELECT t.user_id, u.* FROM tokens t
-                JOIN users u ON t.user_id = u.id
-                WHERE t.token = ? AND t.expires_at > ?
-            ''', (token, datetime.now().isoformat()))
-            row = cur.fetchone()
-            conn.close()
-            if row:
-                g.user = dict(row)
-                g.user_id = row['id']
+        token = extract_token()
+        g.user_id = lookup_token(token) if token else None
         
         return f(*args, **kwargs)
     return decorated
 
 # ============ 健康檢查 ============
+def _timestamped_json(obj):
+    """預先序列化固定內容，只留下 timestamp 於每次請求時接上"""
+    return orjson.dumps(obj)[:-1] + b',"timestamp":"'
+
+_INDEX_PREFIX = _timestamped_json({
+    'name': 'VE-System API',
+    'version': '4.0.0',
+    'status': 'running',
+    'features': ['user_system', 'progress_tracking', 'analytics']
+})
+_LIVE_PREFIX = _timestamped_json({'status': 'alive'})
+_TIMESTAMP_SUFFIX = b'"}'
+_LIVE_BODY = (0, b'')  # (時間戳, 完整 body)，每秒重建一次
+
+def live_body():
+    global _LIVE_BODY
+    now, _, ts = _current_ts()
+    if now != _LIVE_BODY[0]:
+        _LIVE_BODY = (now, _LIVE_PREFIX + ts + _TIMESTAMP_SUFFIX)
+    return _LIVE_BODY[1]
+
 @app.route('/')
 def index():
-    return jsonify({
-        'name': 'VE-System API',
-        'version': '4.0.0',
-        'status': 'running',
-        'features': ['user_system', 'progress_tracking', 'analytics'],
-        'timestamp': datetime.now().isoformat()
-    })
+    body = _INDEX_PREFIX + iso_now_bytes() + _TIMESTAMP_SUFFIX
+    return Response(body, mimetype='application/json')
 
 @app.route('/health')
 @app.route('/health/live')
 def health_live():
-    return jsonify({'status': 'alive', 'timestamp': datetime.now().isoformat()})
+    # 存活探針只由 kubelet/負載平衡器呼叫，沒有瀏覽器前端使用，不需 CORS；body 小於壓縮門檻
+    response = Response(live_body(), mimetype='application/json')
+    response.skip_cors = True
+    return response
+
+# 各資料庫探測互不相依，且 sqlite3 查詢期間會釋放 GIL，可平行執行
+_HEALTH_POOL = ThreadPoolExecutor(max_workers=len(DATABASES) + 1, thread_name_prefix='probe')
+
+def _check_db(db_name):
+    try:
+        with get_db(db_name) as conn:
+            if not conn:
+                return 'not found'
+            conn.execute("SELECT 1")
+            return 'ok'
+    except Exception as e:
+        return f'error: {e}'
+
+def _check_user_db():
+    try:
+        with user_db() as conn:
+            conn.execute("SELECT 1")
+        return 'ok'
+    except Exception:
+        return 'error'
 
 @app.route('/health/ready')
+@cached_response(ttl=5)
 def health_ready():
-    dbs = ['meta', 've', 'trade', 'education', 'business', 'clarity', 'corpus', 'taoist', 'work']
-    status = {}
-    all_ok = True
-    
-    for db in dbs:
-        db_path = os.path.join(DB_DIR, f'{db}.db')
-        if os.path.exists(db_path):
-            try:
-                conn = sqlite3.connect(db_path)
-                conn.execute("SELECT 1")
-                conn.close()
-                status[db] = 'ok'
-            except Exception as e:
-                status[db] = f'error: {e}'
-                all_ok = False
-        else:
-            status[db] = 'not found'
-    
-    # 檢查用戶資料庫
-    try:
-        conn = get_user_db()
-        conn.execute("SELECT 1")
-        conn.close()
-        status['users'] = 'ok'
-    except:
-        status['users'] = 'error'
-        all_ok = False
+    # 用戶資料庫與各資料庫同時探測
+    users_state = _HEALTH_POOL.submit(_check_user_db)
+    status = dict(zip(DATABASES, _HEALTH_POOL.map(_check_db, DATABASES)))
+    status['users'] = users_state.result()
+    all_ok = not any(state.startswith('error') for state in status.values())
     
-    return jsonify({
+    return json_response({
         'status': 'ready' if all_ok else 'partial',
         'databases': status,
-        'timestamp': datetime.now().isoformat()
-    }), 200 if all_ok else 503
+        'timestamp': iso_now()
+    }, 200 if all_ok else 503)
 
 # ============ 用戶系統 API ============
 
@@ -308,43 +875,40 @@ def register():
     
     # 驗證
     if not username or len(username) < 3:
-        return jsonify({'error': '用戶名至少3個字元', 'code': 'INVALID_USERNAME'}), 400
+        return error_response('用戶名至少3個字元', 400, 'INVALID_USERNAME')
     if not password or len(password) < 6:
-        return jsonify({'error': '密碼至少6個字元', 'code': 'INVALID_PASSWORD'}), 400
-    
-    conn = get_user_db()
-    cur = conn.cursor()
+        return error_response('密碼至少6個字元', 400, 'INVALID_PASSWORD')
     
-    # 檢查重複
-    cur.execute('SELECT id FROM users WHERE username = ?', (username,))
-    if cur.fetchone():
-        conn.close()
-        return jsonify({'error': '用戶名已被使用', 'code': 'USERNAME_EXISTS'}), 400
-    
-    if email:
-        cur.execute('SELECT id FROM users WHERE email = ?', (email,))
-        if cur.fetchone():
-            conn.close()
-            return jsonify({'error': 'Email已被使用', 'code': 'EMAIL_EXISTS'}), 400
-    
-    # 建立用戶
+    # PBKDF2 約需數十毫秒 (期間釋放 GIL)，先算好再借連線，避免計算期間佔住連線池
     password_hash = hash_password(password)
-    cur.execute('''
-        INSERT INTO users (username, email, password_hash, display_name)
-        VALUES (?, ?, ?, ?)
-    ''', (username, email, password_hash, display_name))
-    user_id = cur.lastrowid
     
-    # 建立令牌
-    token = generate_token()
-    expires_at = (datetime.now() + timedelta(days=30)).isoformat()
-    cur.execute('INSERT INTO tokens (user_id, token, expires_at) VALUES (?, ?, ?)',
-                (user_id, token, expires_at))
-    
-    conn.commit()
-    conn.close()
+    with user_db() as conn:
+        cur = conn.cursor()
+        
+        # 檢查重複
+        cur.execute('SELECT id FROM users WHERE username = ?', (username,))
+        if cur.fetchone():
+            return error_response('用戶名已被使用', 400, 'USERNAME_EXISTS')
+        
+        if email:
+            cur.execute('SELECT id FROM users WHERE email = ?', (email,))
+            if cur.fetchone():
+                return error_response('Email已被使用', 400, 'EMAIL_EXISTS')
+        
+        # 建立用戶
+        cur.execute('''
+            INSERT INTO users (username, email, password_hash, display_name)
+            VALUES (?, ?, ?, ?)
+        ''', (username, email, password_hash, display_name))
+        user_id = cur.lastrowid
+        
+        # 建立令牌
+        token = generate_token()
+        expires_at = (request_now() + timedelta(days=30)).isoformat()
+        cur.execute('INSERT INTO tokens (user_id, token, expires_at) VALUES (?, ?, ?)',
+                    (user_id, token, expires_at))
     
-    return jsonify({
+    return json_response({
         'success': True,
         'message': '註冊成功',
         'token': token,
@@ -356,7 +920,7 @@ def register():
             'exp': 0,
             'gold': 500
         }
-    }), 201
+    }, 201)
 
 @app.route('/api/v1/auth/login', methods=['POST'])
 def login():
@@ -366,32 +930,30 @@ def login():
     password = data.get('password', '')
     
     if not username or not password:
-        return jsonify({'error': '請輸入用戶名和密碼', 'code': 'MISSING_CREDENTIALS'}), 400
+        return error_response('請輸入用戶名和密碼', 400, 'MISSING_CREDENTIALS')
     
-    conn = get_user_db()
-    cur = conn.cursor()
-    
-    cur.execute('SELECT * FROM users WHERE username = ? OR email = ?', (username, username))
-    user = cur.fetchone()
+    with user_db() as conn:
+        user = conn.execute('SELECT * FROM users WHERE username = ? OR email = ?', (username, username)).fetchone()
     
+    # 驗證密碼時不佔用連線
     if not user or not verify_password(password, user['password_hash']):
-        conn.close()
-        return jsonify({'error': '用戶名或密碼錯誤', 'code': 'INVALID_CREDENTIALS'}), 401
+        return error_response('用戶名或密碼錯誤', 401, 'INVALID_CREDENTIALS')
     
-    # 建立新令牌
-    token = generate_token()
-    expires_at = (datetime.now() + timedelta(days=30)).isoformat()
-    cur.execute('INSERT INTO tokens (user_id, token, expires_at) VALUES (?, ?, ?)',
-                (user['id'], token, expires_at))
-    
-    # 更新最後登入
-    cur.execute('UPDATE users SET last_login = ? WHERE id = ?',
-                (datetime.now().isoformat(), user['id']))
-    
-    conn.commit()
-    conn.close()
+    with user_db() as conn:
+        cur = conn.cursor()
+        
+        # 建立新令牌
+        token = generate_token()
+        now = request_now()
+        expires_at = (now + timedelta(days=30)).isoformat()
+        cur.execute('INSERT INTO tokens (user_id, token, expires_at) VALUES (?, ?, ?)',
+                    (user['id'], token, expires_at))
+        
+        # 更新最後登入
+        cur.execute('UPDATE users SET last_login = ? WHERE id = ?',
+                    (now.isoformat(), user['id']))
     
-    return jsonify({
+    return json_response({
         'success': True,
         'message': '登入成功',
         'token': token,
@@ -412,51 +974,48 @@ def login():
 @require_auth
 def logout():
     """登出"""
-    token = request.headers.get('X-Token') or request.headers.get('Authorization', '').replace('Bearer ', '')
-    conn = get_user_db()
-    cur = conn.cursor()
-    cur.execute('DELETE FROM tokens WHERE token = ?', (token,))
-    conn.commit()
-    conn.close()
-    return jsonify({'success': True, 'message': '已登出'})
+    token = g.token
+    with user_db() as conn:
+        cur = conn.cursor()
+        cur.execute('DELETE FROM tokens WHERE token = ?', (token,))
+    forget_token(token)
+    return json_response({'success': True, 'message': '已登出'})
 
 @app.route('/api/v1/user/profile', methods=['GET'])
 @require_auth
 def get_profile():
     """取得用戶資料"""
-    user = g.user
-    
-    conn = get_user_db()
-    cur = conn.cursor()
-    
-    # 統計
-    cur.execute('''
-        SELECT 
-            COUNT(*) as total_answers,
-            SUM(is_correct) as correct_count,
-            MAX(answered_at) as last_answer
-        FROM answer_history WHERE user_id = ?
-    ''', (g.user_id,))
-    stats = dict(cur.fetchone())
-    
-    # 今日統計
-    today = datetime.now().strftime('%Y-%m-%d')
-    cur.execute('SELECT * FROM daily_stats WHERE user_id = ? AND date = ?', (g.user_id, today))
-    today_stats = cur.fetchone()
-    
-    # 成就數
-    cur.execute('SELECT COUNT(*) FROM user_achievements WHERE user_id = ?', (g.user_id,))
-    achievement_count = cur.fetchone()[0]
-    
-    # 徽章數
-    cur.execute('SELECT COUNT(*) FROM user_badges WHERE user_id = ?', (g.user_id,))
-    badge_count = cur.fetchone()[0]
-    
-    conn.close()
+    with user_db() as conn:
+        cur = conn.cursor()
+        
+        # 用戶資料、答題統計、成就數、徽章數一次查詢 (用戶資料即時讀取，不經令牌快取)
+        cur.execute('''
+            SELECT 
+                u.id, u.username, u.display_name, u.avatar, u.level, u.exp, u.gold,
+                u.hp, u.max_hp, u.created_at,
+                ah.total_answers,
+                ah.correct_count,
+                ah.last_answer,
+                (SELECT COUNT(*) FROM user_achievements WHERE user_id = :uid) as achievement_count,
+                (SELECT COUNT(*) FROM user_badges WHERE user_id = :uid) as badge_count
+            FROM users u, (
+                SELECT COUNT(*) as total_answers, SUM(is_correct) as correct_count, MAX(answered_at) as last_answer
+                FROM answer_history WHERE user_id = :uid
+            ) ah
+            WHERE u.id = :uid
+        ''', {'uid': g.user_id})
+        user = stats = cur.fetchone()
+        achievement_count = stats['achievement_count']
+        badge_count = stats['badge_count']
+        
+        # 今日統計
+        today = iso_now()[:10]
+        cur.execute('SELECT * FROM daily_stats WHERE user_id = ? AND date = ?', (g.user_id, today))
+        today_stats = cur.fetchone()
     
     accuracy = round(stats['correct_count'] / stats['total_answers'] * 100, 1) if stats['total_answers'] else 0
     
-    return jsonify({
+    return json_response({
         'user': {
             'id': user['id'],
             'username': user['username'],
@@ -477,7 +1036,7 @@ def get_profile():
             'achievement_count': achievement_count,
             'badge_count': badge_count
         },
-        'today': dict(today_stats) if today_stats else {
+        'today': today_stats or {
             'questions_answered': 0,
             'correct_count': 0,
             'exp_gained': 0,
@@ -485,6 +1044,16 @@ def get_profile():
         }
     })
 
+# 固定的 SQL 字串讓 statement 快取每次命中；每個欄位附一個「是否提供」旗標，
+# 未提供的欄位保留原值，明確傳入 null 則清空 (與逐欄組 SQL 時相同)
+UPDATE_PROFILE_SQL = '''
+    UPDATE users SET
+        display_name = CASE WHEN ?1 THEN ?2 ELSE display_name END,
+        avatar = CASE WHEN ?3 THEN ?4 ELSE avatar END,
+        settings = CASE WHEN ?5 THEN ?6 ELSE settings END
+    WHERE id = ?7
+'''
+
 @app.route('/api/v1/user/profile', methods=['PUT'])
 @require_auth
 def update_profile():
@@ -492,28 +1061,168 @@ def update_profile():
     data = request.get_json() or {}
     
     allowed_fields = ['display_name', 'avatar', 'settings']
-    updates = []
-    values = []
+    if not any(field in data for field in allowed_fields):
+        return error_response('沒有可更新的欄位', 400)
     
-    for field in allowed_fields:
-        if field in data:
-            updates.append(f'{field} = ?')
-            values.append(json.dumps(data[field]) if field == 'settings' else data[field])
+    settings = json.dumps(data['settings']) if 'settings' in data else None
     
-    if not updates:
-        return jsonify({'error': '沒有可更新的欄位'}), 400
+    with user_db() as conn:
+        conn.execute(UPDATE_PROFILE_SQL, (
+            'display_name' in data, data.get('display_name'),
+            'avatar' in data, data.get('avatar'),
+            'settings' in data, settings,
+            g.user_id))
     
-    values.append(g.user_id)
-    
-    conn = get_user_db()
+    return json_response({'success': True, 'message': '已更新'})
+
+# ============ 進度追蹤 API ============
+
+def _record_answer_core(conn, now_iso, user_id, question_id, subject, is_correct, answer_given, correct_answer,
+                        time_spent=0):
+    """寫入答題記錄並發放獎勵，於呼叫端的交易內執行；回傳獎勵結果
+
+    now_iso 由呼叫端傳入，背景批次寫入時沿用作答當下的時間。
+    """
     cur = conn.cursor()
-    cur.execute(f'UPDATE users SET {", ".join(updates)} WHERE id = ?', values)
-    conn.commit()
-    conn.close()
     
-    return jsonify({'success': True, 'message': '已更新'})
+    # 記錄答題
+    cur.execute('''
+        INSERT INTO answer_history 
+        (user_id, question_id, subject, is_correct, answer_given, correct_answer, time_spent)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (user_id, question_id, subject, 1 if is_correct else 0, answer_given, correct_answer, time_spent))
+    
+    # 計算獎勵
+    exp_gain = 20 if is_correct else 5
+    gold_gain = 10 if is_correct else 0
+    
+    # 更新用戶：於 SQL 內累加並以 RETURNING 取回，不必先讀再寫
+    cur.execute('''
+        UPDATE users SET exp = exp + ?, level = (exp + ?) / 300 + 1, gold = gold + ?
+        WHERE id = ? RETURNING exp, level
+    ''', (exp_gain, exp_gain, gold_gain, user_id))
+    new_exp, new_level = cur.fetchone()
+    level_up = new_level > (new_exp - exp_gain) // 300 + 1
+    
+    # 更新每日統計
+    today = now_iso[:10]
+    cur.execute('''
+        INSERT INTO daily_stats (user_id, date, questions_answered, correct_count, exp_gained, gold_gained)
+        VALUES (?, ?, 1, ?, ?, ?)
+        ON CONFLICT(user_id, date) DO UPDATE SET
+            questions_answered = questions_answered + 1,
+            correct_count = correct_count + excluded.correct_count,
+            exp_gained = exp_gained + excluded.exp_gained,
+            gold_gained = gold_gained + excluded.gold_gained
+    ''', (user_id, today, 1 if is_correct else 0, exp_gain, gold_gain))
+    
+    # 更新學習進度 (科目層級，concept_id 為 NULL)
+    if subject:
+        cur.execute('''
+            INSERT INTO learning_progress (user_id, subject, attempts, correct_count, last_studied, mastery_level)
+            VALUES (?1, ?2, 1, ?3, ?4, ?3 * 100.0)
+            ON CONFLICT(user_id, subject) WHERE concept_id IS NULL DO UPDATE SET
+                attempts = attempts + 1,
+                correct_count = correct_count + excluded.correct_count,
+                last_studied = excluded.last_studied,
+                mastery_level = (correct_count + excluded.correct_count) * 100.0 / (attempts + 1)
+        ''', (user_id, subject, 1 if is_correct else 0, now_iso))
+    
+    return {
+        'recorded': True,
+        'exp_gained': exp_gain,
+        'gold_gained': gold_gain,
+        'new_exp': new_exp,
+        'new_level': new_level,
+        'level_up': level_up
+    }
 
-# ============ 進度追蹤 API ============
+# 答題批次寫入：check_answer 不需回傳獎勵結果，改由背景執行緒累積後以單一交易寫入
+ANSWER_QUEUE_SIZE = 10000
+ANSWER_BATCH_SIZE = 500
+ANSWER_FLUSH_INTERVAL = 0.1  # 秒
+_ANSWER_QUEUE: queue.Queue = queue.Queue(maxsize=ANSWER_QUEUE_SIZE)
+_ANSWER_WRITER: threading.Thread | None = None
+_ANSWER_WRITER_LOCK = threading.Lock()
+
+def write_answers(batch):
+    """以單一交易寫入一批答題 (每筆為 _record_answer_core 除 conn 外的參數)，並使相關用戶快取失效"""
+    with user_db() as conn:
+        for item in batch:
+            _record_answer_core(conn, *item)
+    for user_id in {item[1] for item in batch}:
+        invalidate_user_cache(user_id)
+
+def flush_answers(batch):
+    """寫入一批答題；整批失敗時逐筆重試，只捨棄本身無法寫入的答題"""
+    try:
+        write_answers(batch)
+        return
+    except Exception:
+        if len(batch) == 1:
+            app.logger.exception('答題寫入失敗，已捨棄：%r', batch[0])
+            return
+        app.logger.exception('答題批次寫入失敗，共 %d 筆，改為逐筆寫入', len(batch))
+    for item in batch:
+        try:
+            write_answers([item])
+        except Exception:
+            app.logger.exception('答題寫入失敗，已捨棄：%r', item)
+
+_ANSWER_STOP = object()  # 結束時排入佇列，通知背景執行緒寫完手上的批次後停止
+ANSWER_WRITER_JOIN_TIMEOUT = 10  # 秒
+
+def _answer_writer():
+    stopping = False
+    while not stopping:
+        item = _ANSWER_QUEUE.get()
+        if item is _ANSWER_STOP:
+            break
+        batch = [item]
+        deadline = time.monotonic() + ANSWER_FLUSH_INTERVAL
+        while len(batch) < ANSWER_BATCH_SIZE:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = _ANSWER_QUEUE.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _ANSWER_STOP:
+                stopping = True
+                break
+            batch.append(item)
+        flush_answers(batch)
+
+def enqueue_answer(item):
+    """排入答題記錄；背景執行緒於首次使用時啟動 (每個 worker 各一)，佇列已滿時改為同步寫入"""
+    global _ANSWER_WRITER
+    if _ANSWER_WRITER is None:
+        with _ANSWER_WRITER_LOCK:
+            if _ANSWER_WRITER is None:
+                _ANSWER_WRITER = threading.Thread(target=_answer_writer, name='answer-writer', daemon=True)
+                _ANSWER_WRITER.start()
+    try:
+        _ANSWER_QUEUE.put_nowait(item)
+    except queue.Full:
+        write_answers([item])
+
+@atexit.register
+def flush_answer_queue():
+    """結束前停止背景執行緒 (等待進行中的批次寫完)，再寫入佇列中尚未處理的答題"""
+    if _ANSWER_WRITER is not None and _ANSWER_WRITER.is_alive():
+        _ANSWER_QUEUE.put(_ANSWER_STOP)
+        _ANSWER_WRITER.join(ANSWER_WRITER_JOIN_TIMEOUT)
+    batch = []
+    while True:
+        try:
+            item = _ANSWER_QUEUE.get_nowait()
+        except queue.Empty:
+            break
+        if item is not _ANSWER_STOP:  # 背景執行緒逾時未停止時，停止信號仍留在佇列中
+            batch.append(item)
+    if batch:
+        flush_answers(batch)
 
 @app.route('/api/v1/progress/answer', methods=['POST'])
 @optional_auth
@@ -521,86 +1230,25 @@ def record_answer():
     """記錄答題"""
     data = request.get_json() or {}
     question_id = data.get('question_id')
-    subject = data.get('subject')
-    is_correct = data.get('is_correct', False)
-    answer_given = data.get('answer_given')
-    correct_answer = data.get('correct_answer')
-    time_spent = data.get('time_spent', 0)
     
     if not question_id:
-        return jsonify({'error': '缺少 question_id'}), 400
+        return error_response('缺少 question_id', 400)
     
-    result = {
-        'recorded': False,
-        'exp_gained': 0,
-        'gold_gained': 0,
-        'level_up': False
-    }
+    if not g.user_id:
+        return json_response({
+            'recorded': False,
+            'exp_gained': 0,
+            'gold_gained': 0,
+            'level_up': False
+        })
     
-    if g.user_id:
-        conn = get_user_db()
-        cur = conn.cursor()
-        
-        # 記錄答題
-        cur.execute('''
-            INSERT INTO answer_history 
-            (user_id, question_id, subject, is_correct, answer_given, correct_answer, time_spent)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (g.user_id, question_id, subject, 1 if is_correct else 0, answer_given, correct_answer, time_spent))
-        
-        # 計算獎勵
-        exp_gain = 20 if is_correct else 5
-        gold_gain = 10 if is_correct else 0
-        
-        # 更新用戶
-        cur.execute('SELECT level, exp FROM users WHERE id = ?', (g.user_id,))
-        user = cur.fetchone()
-        new_exp = user['exp'] + exp_gain
-        new_level = (new_exp // 300) + 1
-        level_up = new_level > user['level']
-        
-        cur.execute('UPDATE users SET exp = ?, level = ?, gold = gold + ? WHERE id = ?',
-                    (new_exp, new_level, gold_gain, g.user_id))
-        
-        # 更新每日統計
-        today = datetime.now().strftime('%Y-%m-%d')
-        cur.execute('''
-            INSERT INTO daily_stats (user_id, date, questions_answered, correct_count, exp_gained, gold_gained)
-            VALUES (?, ?, 1, ?, ?, ?)
-            ON CONFLICT(user_id, date) DO UPDATE SET
-                questions_answered = questions_answered + 1,
-                correct_count = correct_count + ?,
-                exp_gained = exp_gained + ?,
-                gold_gained = gold_gained + ?
-        ''', (g.user_id, today, 1 if is_correct else 0, exp_gain, gold_gain,
-              1 if is_correct else 0, exp_gain, gold_gain))
-        
-        # 更新學習進度
-        if subject:
-            cur.execute('''
-                INSERT INTO learning_progress (user_id, subject, attempts, correct_count, last_studied)
-                VALUES (?, ?, 1, ?, ?)
-                ON CONFLICT(user_id, subject, concept_id) DO UPDATE SET
-                    attempts = attempts + 1,
-                    correct_count = correct_count + ?,
-                    last_studied = ?,
-                    mastery_level = CAST(correct_count + ? AS REAL) / (attempts + 1) * 100
-            ''', (g.user_id, subject, 1 if is_correct else 0, datetime.now().isoformat(),
-                  1 if is_correct else 0, datetime.now().isoformat(), 1 if is_correct else 0))
-        
-        conn.commit()
-        conn.close()
-        
-        result = {
-            'recorded': True,
-            'exp_gained': exp_gain,
-            'gold_gained': gold_gain,
-            'new_exp': new_exp,
-            'new_level': new_level,
-            'level_up': level_up
-        }
+    with user_db() as conn:
+        result = _record_answer_core(
+            conn, request_now().isoformat(), g.user_id, question_id, data.get('subject'), data.get('is_correct', False),
+            data.get('answer_given'), data.get('correct_answer'), data.get('time_spent', 0))
+    invalidate_user_cache(g.user_id)
     
-    return jsonify(result)
+    return json_response(result)
 
 @app.route('/api/v1/progress/game', methods=['POST'])
 @optional_auth
@@ -612,177 +1260,172 @@ def record_game_progress():
     score = data.get('score', 0)
     
     if not scenario_id:
-        return jsonify({'error': '缺少 scenario_id'}), 400
+        return error_response('缺少 scenario_id', 400)
     
     if g.user_id:
-        conn = get_user_db()
-        cur = conn.cursor()
-        
-        cur.execute('''
-            INSERT INTO game_progress (user_id, scenario_id, completed, score, completed_at)
-            VALUES (?, ?, ?, ?, ?)
-            ON CONFLICT(user_id, scenario_id) DO UPDATE SET
-                completed = MAX(completed, ?),
-                score = MAX(score, ?),
-                completed_at = CASE WHEN ? > completed THEN ? ELSE completed_at END
-        ''', (g.user_id, scenario_id, 1 if completed else 0, score, 
-              datetime.now().isoformat() if completed else None,
-              1 if completed else 0, score, 1 if completed else 0, datetime.now().isoformat()))
-        
-        conn.commit()
-        conn.close()
+        now_iso = request_now().isoformat()
+        with user_db() as conn:
+            cur = conn.cursor()
+            
+            cur.execute('''
+                INSERT INTO game_progress (user_id, scenario_id, completed, score, completed_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(user_id, scenario_id) DO UPDATE SET
+                    completed = MAX(completed, ?),
+                    score = MAX(score, ?),
+                    completed_at = CASE WHEN ? > completed THEN ? ELSE completed_at END
+            ''', (g.user_id, scenario_id, 1 if completed else 0, score, 
+                  now_iso if completed else None,
+                  1 if completed else 0, score, 1 if completed else 0, now_iso))
         
-        return jsonify({'success': True, 'recorded': True})
+        return json_response({'success': True, 'recorded': True})
     
-    return jsonify({'success': True, 'recorded': False, 'message': '未登入，進度未保存'})
+    return json_response({'success': True, 'recorded': False, 'message': '未登入，進度未保存'})
 
 @app.route('/api/v1/progress/history', methods=['GET'])
 @require_auth
 def get_answer_history():
     """取得答題歷史"""
-    limit = request.args.get('limit', 50, type=int)
+    limit = get_limit(50)
     offset = request.args.get('offset', 0, type=int)
     subject = request.args.get('subject')
     
-    conn = get_user_db()
-    cur = conn.cursor()
-    
-    if subject:
-        cur.execute('''
-            SELECT * FROM answer_history 
-            WHERE user_id = ? AND subject = ?
-            ORDER BY answered_at DESC LIMIT ? OFFSET ?
-        ''', (g.user_id, subject, limit, offset))
-    else:
-        cur.execute('''
-            SELECT * FROM answer_history 
-            WHERE user_id = ?
-            ORDER BY answered_at DESC LIMIT ? OFFSET ?
-        ''', (g.user_id, limit, offset))
-    
-    history = [dict(row) for row in cur.fetchall()]
-    conn.close()
+    with user_db() as conn:
+        cur = conn.cursor()
+        
+        if subject:
+            cur.execute('''
+                SELECT * FROM answer_history 
+                WHERE user_id = ? AND subject = ?
+                ORDER BY answered_at DESC LIMIT ? OFFSET ?
+            ''', (g.user_id, subject, limit, offset))
+        else:
+            cur.execute('''
+                SELECT * FROM answer_history 
+                WHERE user_id = ?
+                ORDER BY answered_at DESC LIMIT ? OFFSET ?
+            ''', (g.user_id, limit, offset))
+        
+        history = cur.fetchall()
     
-    return jsonify({'history': history, 'count': len(history)})
+    return json_response({'history': history, 'count': len(history)})
 
 # ============ 學習分析 API ============
 
+# 學習分析總覽快取：user_id -> (到期時間, 用戶版本, body)；記錄答題時用戶版本遞增即失效
+_ANALYTICS_CACHE: dict[int, tuple[float, int, bytes]] = {}
+ANALYTICS_TTL = 30
+
 @app.route('/api/v1/analytics/overview', methods=['GET'])
 @require_auth
 def get_analytics_overview():
     """學習分析總覽"""
-    conn = get_user_db()
-    cur = conn.cursor()
-    
-    # 各科統計
-    cur.execute('''
-        SELECT 
-            subject,
-            COUNT(*) as total,
-            SUM(is_correct) as correct,
-            ROUND(CAST(SUM(is_correct) AS REAL) / COUNT(*) * 100, 1) as accuracy
-        FROM answer_history 
-        WHERE user_id = ?
-        GROUP BY subject
-    ''', (g.user_id,))
-    by_subject = [dict(row) for row in cur.fetchall()]
-    
-    # 每日趨勢 (最近7天)
-    cur.execute('''
-        SELECT 
-            date,
-            questions_answered,
-            correct_count,
-            exp_gained,
-            max_streak
-        FROM daily_stats 
-        WHERE user_id = ?
-        ORDER BY date DESC LIMIT 7
-    ''', (g.user_id,))
-    daily_trend = [dict(row) for row in cur.fetchall()]
-    
-    # 弱點分析 (正確率最低的科目)
-    cur.execute('''
-        SELECT 
-            subject,
-            COUNT(*) as total,
-            SUM(is_correct) as correct,
-            ROUND(CAST(SUM(is_correct) AS REAL) / COUNT(*) * 100, 1) as accuracy
-        FROM answer_history 
-        WHERE user_id = ?
-        GROUP BY subject
-        HAVING total >= 5
-        ORDER BY accuracy ASC
-        LIMIT 3
-    ''', (g.user_id,))
-    weak_subjects = [dict(row) for row in cur.fetchall()]
-    
-    # 學習時間分布
-    cur.execute('''
-        SELECT 
-            strftime('%H', answered_at) as hour,
-            COUNT(*) as count
-        FROM answer_history 
-        WHERE user_id = ?
-        GROUP BY hour
-        ORDER BY hour
-    ''', (g.user_id,))
-    hourly_dist = [dict(row) for row in cur.fetchall()]
-    
-    # 連勝記錄
-    cur.execute('SELECT MAX(max_streak) as best_streak FROM daily_stats WHERE user_id = ?', (g.user_id,))
-    best_streak = cur.fetchone()['best_streak'] or 0
+    now = time.monotonic()
+    version = _USER_VERSIONS.get(g.user_id, 0)
+    hit = _ANALYTICS_CACHE.get(g.user_id)
+    if hit and hit[0] > now and hit[1] == version:
+        return Response(hit[2], mimetype='application/json')
     
-    conn.close()
+    with user_db() as conn:
+        cur = conn.cursor()
+        
+        # 各科統計
+        cur.execute('''
+            SELECT 
+                subject,
+                COUNT(*) as total,
+                SUM(is_correct) as correct,
+                ROUND(CAST(SUM(is_correct) AS REAL) / COUNT(*) * 100, 1) as accuracy
+            FROM answer_history 
+            WHERE user_id = ?
+            GROUP BY subject
+        ''', (g.user_id,))
+        by_subject = cur.fetchall()
+        
+        # 每日趨勢 (最近7天)
+        cur.execute('''
+            SELECT 
+                date,
+                questions_answered,
+                correct_count,
+                exp_gained,
+                max_streak
+            FROM daily_stats 
+            WHERE user_id = ?
+            ORDER BY date DESC LIMIT 7
+        ''', (g.user_id,))
+        daily_trend = cur.fetchall()
+        
+        # 弱點分析 (正確率最低的科目)，與各科統計同一組聚合，不必再掃描一次
+        weak_subjects = sorted((row for row in by_subject if row['total'] >= 5),
+                               key=lambda row: row['accuracy'])[:3]
+        
+        # 學習時間分布
+        cur.execute('''
+            SELECT 
+                strftime('%H', answered_at) as hour,
+                COUNT(*) as count
+            FROM answer_history 
+            WHERE user_id = ?
+            GROUP BY hour
+            ORDER BY hour
+        ''', (g.user_id,))
+        hourly_dist = cur.fetchall()
+        
+        # 連勝記錄
+        cur.execute('SELECT MAX(max_streak) as best_streak FROM daily_stats WHERE user_id = ?', (g.user_id,))
+        best_streak = cur.fetchone()['best_streak'] or 0
     
-    return jsonify({
+    response = json_response({
         'by_subject': by_subject,
         'daily_trend': daily_trend,
         'weak_subjects': weak_subjects,
         'hourly_distribution': hourly_dist,
         'best_streak': best_streak
     })
+    if len(_ANALYTICS_CACHE) >= AUTH_CACHE_SIZE:
+        _ANALYTICS_CACHE.clear()
+    _ANALYTICS_CACHE[g.user_id] = (now + ANALYTICS_TTL, version, response.get_data())
+    return response
 
 @app.route('/api/v1/analytics/subject/<subject>', methods=['GET'])
 @require_auth
 def get_subject_analytics(subject):
     """單科目分析"""
-    conn = get_user_db()
-    cur = conn.cursor()
-    
-    # 基本統計
-    cur.execute('''
-        SELECT 
-            COUNT(*) as total,
-            SUM(is_correct) as correct,
-            ROUND(CAST(SUM(is_correct) AS REAL) / COUNT(*) * 100, 1) as accuracy,
-            AVG(time_spent) as avg_time
-        FROM answer_history 
-        WHERE user_id = ? AND subject = ?
-    ''', (g.user_id, subject))
-    stats = dict(cur.fetchone())
-    
-    # 最近答題
-    cur.execute('''
-        SELECT question_id, is_correct, answered_at
-        FROM answer_history 
-        WHERE user_id = ? AND subject = ?
-        ORDER BY answered_at DESC LIMIT 20
-    ''', (g.user_id, subject))
-    recent = [dict(row) for row in cur.fetchall()]
-    
-    # 錯題
-    cur.execute('''
-        SELECT question_id, answer_given, correct_answer, answered_at
-        FROM answer_history 
-        WHERE user_id = ? AND subject = ? AND is_correct = 0
-        ORDER BY answered_at DESC LIMIT 10
-    ''', (g.user_id, subject))
-    wrong_answers = [dict(row) for row in cur.fetchall()]
-    
-    conn.close()
-    
-    return jsonify({
+    with user_db() as conn:
+        cur = conn.cursor()
+        
+        # 基本統計
+        cur.execute('''
+            SELECT 
+                COUNT(*) as total,
+                SUM(is_correct) as correct,
+                ROUND(CAST(SUM(is_correct) AS REAL) / COUNT(*) * 100, 1) as accuracy,
+                AVG(time_spent) as avg_time
+            FROM answer_history 
+            WHERE user_id = ? AND subject = ?
+        ''', (g.user_id, subject))
+        stats = cur.fetchone()
+        
+        # 最近答題
+        cur.execute('''
+            SELECT question_id, is_correct, answered_at
+            FROM answer_history 
+            WHERE user_id = ? AND subject = ?
+            ORDER BY answered_at DESC LIMIT 20
+        ''', (g.user_id, subject))
+        recent = cur.fetchall()
+        
+        # 錯題
+        cur.execute('''
+            SELECT question_id, answer_given, correct_answer, answered_at
+            FROM answer_history 
+            WHERE user_id = ? AND subject = ? AND is_correct = 0
+            ORDER BY answered_at DESC LIMIT 10
+        ''', (g.user_id, subject))
+        wrong_answers = cur.fetchall()
+    
+    return json_response({
         'subject': subject,
         'stats': stats,
         'recent': recent,
@@ -793,35 +1436,33 @@ def get_subject_analytics(subject):
 @require_auth
 def get_recommendations():
     """學習推薦"""
-    conn = get_user_db()
-    cur = conn.cursor()
-    
-    # 找出弱點科目
-    cur.execute('''
-        SELECT 
-            subject,
-            ROUND(CAST(SUM(is_correct) AS REAL) / COUNT(*) * 100, 1) as accuracy
-        FROM answer_history 
-        WHERE user_id = ?
-        GROUP BY subject
-        HAVING COUNT(*) >= 3
-        ORDER BY accuracy ASC
-        LIMIT 3
-    ''', (g.user_id,))
-    weak = [dict(row) for row in cur.fetchall()]
-    
-    # 找出需要複習的 (超過3天沒練習)
-    three_days_ago = (datetime.now() - timedelta(days=3)).isoformat()
-    cur.execute('''
-        SELECT subject, last_studied, mastery_level
-        FROM learning_progress
-        WHERE user_id = ? AND last_studied < ?
-        ORDER BY mastery_level ASC
-        LIMIT 5
-    ''', (g.user_id, three_days_ago))
-    need_review = [dict(row) for row in cur.fetchall()]
-    
-    conn.close()
+    with user_db() as conn:
+        cur = conn.cursor()
+        
+        # 找出弱點科目
+        cur.execute('''
+            SELECT 
+                subject,
+                ROUND(CAST(SUM(is_correct) AS REAL) / COUNT(*) * 100, 1) as accuracy
+            FROM answer_history 
+            WHERE user_id = ?
+            GROUP BY subject
+            HAVING COUNT(*) >= 3
+            ORDER BY accuracy ASC
+            LIMIT 3
+        ''', (g.user_id,))
+        weak = cur.fetchall()
+        
+        # 找出需要複習的 (超過3天沒練習)
+        three_days_ago = (request_now() - timedelta(days=3)).isoformat()
+        cur.execute('''
+            SELECT subject, last_studied, mastery_level
+            FROM learning_progress
+            WHERE user_id = ? AND last_studied < ?
+            ORDER BY mastery_level ASC
+            LIMIT 5
+        ''', (g.user_id, three_days_ago))
+        need_review = cur.fetchall()
     
     recommendations = []
     
@@ -841,189 +1482,211 @@ def get_recommendations():
             'message': f"你已經{3}天沒有練習{r['subject']}了，記得複習哦"
         })
     
-    return jsonify({'recommendations': recommendations})
+    return json_response({'recommendations': recommendations})
 
 # ============ 排行榜 API ============
 
 @app.route('/api/v1/leaderboard', methods=['GET'])
+@cached_response(ttl=30)
 def get_leaderboard():
     """排行榜"""
     board_type = request.args.get('type', 'exp')  # exp, accuracy, streak
-    limit = request.args.get('limit', 10, type=int)
-    
-    conn = get_user_db()
-    cur = conn.cursor()
+    limit = get_limit(10)
     
-    if board_type == 'exp':
-        cur.execute('''
-            SELECT id, username, display_name, avatar, level, exp
-            FROM users ORDER BY exp DESC LIMIT ?
-        ''', (limit,))
-    elif board_type == 'accuracy':
-        cur.execute('''
-            SELECT u.id, u.username, u.display_name, u.avatar, u.level,
-                   ROUND(CAST(SUM(ah.is_correct) AS REAL) / COUNT(*) * 100, 1) as accuracy
-            FROM users u
-            JOIN answer_history ah ON u.id = ah.user_id
-            GROUP BY u.id
-            HAVING COUNT(*) >= 10
-            ORDER BY accuracy DESC
-            LIMIT ?
-        ''', (limit,))
-    else:  # streak
-        cur.execute('''
-            SELECT u.id, u.username, u.display_name, u.avatar, u.level,
-                   MAX(ds.max_streak) as best_streak
-            FROM users u
-            JOIN daily_stats ds ON u.id = ds.user_id
-            GROUP BY u.id
-            ORDER BY best_streak DESC
-            LIMIT ?
-        ''', (limit,))
-    
-    rankings = [dict(row) for row in cur.fetchall()]
-    conn.close()
+    with user_db() as conn:
+        cur = conn.cursor()
+        
+        if board_type == 'exp':
+            cur.execute('''
+                SELECT id, username, display_name, avatar, level, exp
+                FROM users ORDER BY exp DESC LIMIT ?
+            ''', (limit,))
+        elif board_type == 'accuracy':
+            # 先在 answer_history 上聚合並取前 N 名，再只對這 N 筆 JOIN users
+            cur.execute('''
+                WITH agg AS (
+                    SELECT user_id,
+                           ROUND(CAST(SUM(is_correct) AS REAL) / COUNT(*) * 100, 1) as accuracy
+                    FROM answer_history
+                    GROUP BY user_id
+                    HAVING COUNT(*) >= 10
+                    ORDER BY accuracy DESC
+                    LIMIT ?
+                )
+                SELECT u.id, u.username, u.display_name, u.avatar, u.level, agg.accuracy
+                FROM agg JOIN users u ON u.id = agg.user_id
+                ORDER BY agg.accuracy DESC
+            ''', (limit,))
+        else:  # streak
+            cur.execute('''
+                WITH agg AS (
+                    SELECT user_id, MAX(max_streak) as best_streak
+                    FROM daily_stats
+                    GROUP BY user_id
+                    ORDER BY best_streak DESC
+                    LIMIT ?
+                )
+                SELECT u.id, u.username, u.display_name, u.avatar, u.level, agg.best_streak
+                FROM agg JOIN users u ON u.id = agg.user_id
+                ORDER BY agg.best_streak DESC
+            ''', (limit,))
+        
+        rankings = [dict(row) for row in cur.fetchall()]
     
     # 加入排名
     for i, r in enumerate(rankings):
         r['rank'] = i + 1
     
-    return jsonify({'type': board_type, 'rankings': rankings})
+    return json_response({'type': board_type, 'rankings': rankings})
 
 # ============ 原有 API (保持相容) ============
 
+def _db_stats(db_name):
+    with get_db(db_name) as conn:
+        if not conn:
+            return {'status': 'not found'}
+        try:
+            counts = get_table_counts(db_name, conn)
+            record_count = sum(count for count in counts.values() if count > 0)
+            return {'tables': len(counts), 'records': record_count, 'status': 'ok'}
+        except Exception as e:
+            return {'status': 'error', 'error': str(e)}
+
 @app.route('/api/v1/status')
+@cached_response(ttl=30, client_cache=True)
 def system_status():
-    dbs = ['meta', 've', 'trade', 'education', 'business', 'clarity', 'corpus', 'taoist', 'work']
-    db_stats = {}
-    total_tables = 0
-    total_records = 0
-    
-    for db_name in dbs:
-        conn = get_db(db_name)
-        if conn:
-            try:
-                cur = conn.cursor()
-                tables = cur.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()
-                table_count = len(tables)
-                record_count = 0
-                for (table,) in tables:
-                    try:
-                        count = cur.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
-                        record_count += count
-                    except:
-                        pass
-                db_stats[db_name] = {'tables': table_count, 'records': record_count, 'status': 'ok'}
-                total_tables += table_count
-                total_records += record_count
-                conn.close()
-            except Exception as e:
-                db_stats[db_name] = {'status': 'error', 'error': str(e)}
-        else:
-            db_stats[db_name] = {'status': 'not found'}
+    # 資料庫檔案未變動時計數也不會變，直接回 304
+    etag = db_files_etag(DATABASES)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    db_stats = dict(zip(DATABASES, _HEALTH_POOL.map(_db_stats, DATABASES)))
+    total_tables = sum(d.get('tables', 0) for d in db_stats.values())
+    total_records = sum(d.get('records', 0) for d in db_stats.values())
     
-    return jsonify({
+    response = json_response({
         'total_databases': len([d for d in db_stats.values() if d.get('status') == 'ok']),
         'total_tables': total_tables,
         'total_records': total_records,
         'databases': db_stats,
-        'timestamp': datetime.now().isoformat()
+        'timestamp': iso_now()
     })
+    response.set_etag(etag, weak=True)
+    return response
 
 @app.route('/api/v1/db/<db_name>/tables')
+@cached_response(ttl=30, client_cache=True)
 def list_tables(db_name):
-    conn = get_db(db_name)
-    if not conn:
-        return jsonify({'error': f'資料庫 {db_name} 不存在'}), 404
+    if db_name not in _ALLOWED_DBS:
+        return error_response(f'資料庫 {db_name} 不存在', 404)
     
-    cur = conn.cursor()
-    tables = cur.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name").fetchall()
+    etag = db_files_etag((db_name,))
+    cached = not_modified(etag)
+    if cached:
+        return cached
     
-    result = []
-    for (table,) in tables:
-        try:
-            count = cur.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
-            result.append({'name': table, 'count': count})
-        except:
-            result.append({'name': table, 'count': -1})
+    with get_db(db_name) as conn:
+        if not conn:
+            return error_response(f'資料庫 {db_name} 不存在', 404)
+        
+        counts = get_table_counts(db_name, conn)
+        result = [{'name': table, 'count': counts[table]} for table in get_tables(db_name, conn)]
     
-    conn.close()
-    return jsonify({'database': db_name, 'tables': result, 'count': len(result)})
+    response = json_response({'database': db_name, 'tables': result, 'count': len(result)})
+    response.set_etag(etag, weak=True)
+    return response
 
 @app.route('/api/v1/db/<db_name>/table/<table_name>')
+@cached_response(ttl=30)
 def query_table(db_name, table_name):
-    conn = get_db(db_name)
-    if not conn:
-        return jsonify({'error': f'資料庫 {db_name} 不存在'}), 404
-    
-    limit = request.args.get('limit', 100, type=int)
-    offset = request.args.get('offset', 0, type=int)
-    
-    cur = conn.cursor()
-    try:
-        cur.execute(f'SELECT * FROM "{table_name}" LIMIT ? OFFSET ?', (limit, offset))
-        columns = [desc[0] for desc in cur.description]
-        rows = cur.fetchall()
-        data = [dict(zip(columns, row)) for row in rows]
+    if db_name not in _ALLOWED_DBS:
+        return error_response(f'資料庫 {db_name} 不存在', 404)
+    with get_db(db_name) as conn:
+        if not conn:
+            return error_response(f'資料庫 {db_name} 不存在', 404)
         
-        cur.execute(f'SELECT COUNT(*) FROM "{table_name}"')
-        total = cur.fetchone()[0]
+        if not has_table(db_name, table_name, conn):
+            return error_response(f'資料表 {table_name} 不存在', 404)
         
-        conn.close()
-        return jsonify({'table': table_name, 'data': data, 'count': len(data), 'total': total})
-    except Exception as e:
-        conn.close()
-        return jsonify({'error': str(e)}), 400
+        # 唯讀資料庫的內容只隨檔案替換而變，ETag 取自檔案 mtime 與查詢字串，不必另外掃描資料表
+        etag = hashlib.sha1(f'{db_files_etag((db_name,))}:{table_name}:{request.query_string!r}'.encode()).hexdigest()[:16]
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
+        limit = get_limit(100)
+        offset = request.args.get('offset', 0, type=int)
+        
+        cur = conn.cursor()
+        cur.arraysize = limit or 1
+        try:
+            columns = get_columns(db_name, table_name, conn)
+            cur.execute(page_sql(table_name), (limit, offset))
+            data = list(rows_to_dicts(columns, cur.fetchmany()))
+            
+            total = get_table_counts(db_name, conn)[table_name]
+        except Exception as e:
+            return json_response({'error': str(e)}, 400)
+    
+    response = json_response({'table': table_name, 'data': data, 'count': len(data), 'total': total})
+    response.set_etag(etag, weak=True)
+    return response
+
+# ============ 管理 API ============
+# 管理 API 以 X-Admin-Token 標頭比對環境變數 ADMIN_TOKEN；未設定 ADMIN_TOKEN 時管理 API 一律拒絕
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+def require_admin(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = request.headers.get('X-Admin-Token', '')
+        if not ADMIN_TOKEN or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+            return error_response('需要管理權限', 403, 'ADMIN_REQUIRED')
+        return f(*args, **kwargs)
+    return decorated
+
+@app.route('/api/v1/admin/schema-cache', methods=['DELETE'])
+@require_admin
+def reset_schema_cache():
+    """重新讀取資料庫檔案並清除結構、題庫與回應快取"""
+    clear_schema_cache()
+    return json_response({'success': True, 'message': '結構快取已清除'})
 
 # 教育系統 API
+# 同一科目與筆數的抽題結果沿用 5 秒，熱門組合直接回傳已序列化的 bytes
 @app.route('/api/v1/education/questions')
+@cached_response(ttl=5)
 def get_questions():
-    limit = request.args.get('limit', 10, type=int)
+    limit = get_limit(10)
     subject = request.args.get('subject')
     
-    conn = get_db('education')
-    if not conn:
-        return jsonify({'error': '教育資料庫不存在'}), 404
-    
-    cur = conn.cursor()
-    
-    # 只回傳有有效選項的選擇題
-    base_query = '''
-        SELECT * FROM exam_questions 
-        WHERE options IS NOT NULL 
-          AND options != '' 
-          AND options != '[]'
-          AND length(options) > 10
-    '''
-    
-    if subject and subject != 'all':
-        cur.execute(base_query + ' AND subject_id LIKE ? ORDER BY RANDOM() LIMIT ?', 
-                    (f'%{subject}%', limit * 2))
-    else:
-        cur.execute(base_query + ' ORDER BY RANDOM() LIMIT ?', (limit * 2,))
-    
-    rows = cur.fetchall()
-    columns = [desc[0] for desc in cur.description]
-    questions = []
+    pool = _QUESTION_POOL
+    if pool is None:
+        with get_db('education') as conn:
+            if not conn:
+                return error_response('教育資料庫不存在', 404)
+            pool = load_question_pool(conn)
     
-    for row in rows:
-        q = dict(zip(columns, row))
-        if isinstance(q.get('options'), str):
-            try:
-                opts = json.loads(q['options'])
-                if isinstance(opts, list) and len(opts) >= 2:
-                    q['options'] = opts
-                    questions.append(q)
-            except:
-                pass
-        elif isinstance(q.get('options'), list) and len(q['options']) >= 2:
-            questions.append(q)
-        
-        if len(questions) >= limit:
-            break
+    # 只回傳有有效選項的選擇題：自題池隨機抽樣，random.sample 的結果已是隨機順序
+    indices = question_indices(pool, subject if subject and subject != 'all' else '')
+    questions = [pool[i] for i in random.sample(indices, min(limit, len(indices)))]
     
-    conn.close()
-    return jsonify({'questions': questions, 'count': len(questions)})
+    return json_response({'questions': questions, 'count': len(questions)})
+
+# 作答格式先以正規表示式檢查，格式不符的請求不必查詢資料庫
+# 填空題的答案可為任意文字 (如「立法院」)，故只限制長度與控制字元，並須含非空白字元
+QUESTION_ID_RE = re.compile(r'[A-Za-z0-9_-]{1,64}')
+ANSWER_RE = re.compile(r'(?=.*\S)[^\x00-\x1f]{1,64}')
+
+def answers_match(answer, correct_answer):
+    """不分大小寫比對作答；單一 ASCII 字元 (A/B/C/D) 直接比對字碼，不建立新字串"""
+    a = answer.strip()
+    b = (correct_answer or '').strip()
+    if len(a) == 1 and len(b) == 1 and a.isascii() and b.isascii():
+        # 同一字母的大小寫字碼只差 0x20
+        return a == b or (a.isalpha() and ord(a) ^ ord(b) == 0x20)
+    return a.casefold() == b.casefold()
 
 @app.route('/api/v1/education/check', methods=['POST'])
 @optional_auth
@@ -1033,45 +1696,67 @@ def check_answer():
     answer = data.get('answer')
     
     if not question_id or not answer:
-        return jsonify({'error': '缺少必要參數'}), 400
-    
-    conn = get_db('education')
-    if not conn:
-        return jsonify({'error': '教育資料庫不存在'}), 404
-    
-    cur = conn.cursor()
-    cur.execute('SELECT answer, explanation, subject_id FROM exam_questions WHERE question_id = ?', (question_id,))
-    row = cur.fetchone()
-    conn.close()
-    
-    if not row:
-        return jsonify({'error': '題目不存在'}), 404
+        return error_response('缺少必要參數', 400)
+    if not (isinstance(question_id, str) and isinstance(answer, str)
+            and QUESTION_ID_RE.fullmatch(question_id) and ANSWER_RE.fullmatch(answer)):
+        return error_response('參數格式錯誤', 400)
+    
+    row = _ANSWER_CACHE.get(question_id)
+    if row is None:
+        with get_db('education') as conn:
+            if not conn:
+                return error_response('教育資料庫不存在', 404)
+            row = conn.execute(CHECK_ANSWER_SQL, (question_id,)).fetchone()
+        
+        if not row:
+            return error_response('題目不存在', 404)
+        if len(_ANSWER_CACHE) >= ANSWER_CACHE_SIZE:
+            _ANSWER_CACHE.clear()
+        row = _ANSWER_CACHE[question_id] = tuple(row)
     
-    correct_answer = row[0]
-    explanation = row[1]
-    subject = row[2]
-    is_correct = answer.upper() == correct_answer.upper()
+    correct_answer, explanation, subject = row
+    is_correct = answers_match(answer, correct_answer)
     
-    # 自動記錄 (如果已登入)
+    # 自動記錄 (如果已登入)：排入背景批次寫入，不等待磁碟
     if g.user_id:
-        record_data = {
-            'question_id': question_id,
-            'subject': subject,
-            'is_correct': is_correct,
-            'answer_given': answer,
-            'correct_answer': correct_answer
-        }
-        with app.test_request_context(json=record_data):
-            g.user_id = g.user_id
-            record_answer()
+        enqueue_answer((request_now().isoformat(), g.user_id, question_id, subject, is_correct, answer, correct_answer))
     
-    return jsonify({
+    return json_response({
         'correct': is_correct,
         'correct_answer': correct_answer,
         'explanation': explanation
     })
 
+def run_gunicorn():
+    """以 gunicorn gthread worker 啟動，設定沿用 gunicorn.conf.py"""
+    import runpy
+    from gunicorn.app.base import BaseApplication
+    
+    conf_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')
+    
+    class StandaloneApplication(BaseApplication):
+        def load_config(self):
+            for key, value in runpy.run_path(conf_path).items():
+                if key in self.cfg.settings and value is not None:
+                    self.cfg.set(key, value)
+        
+        def load(self):
+            # 未啟用 preload 時於 worker fork 後呼叫：在 worker 內重新預熱連線池
+            warm_db_pool()
+            return app
+    
+    # SQLite 連線不可跨 fork 沿用：匯入時在 master 預熱的連線先關閉，由各 worker 自行開啟
+    close_db_pool()
+    close_user_db_pool()
+    StandaloneApplication().run()
+
 if __name__ == '__main__':
-    port = int(os.environ.get('PORT', 5000))
+    from importlib.util import find_spec
+    
     debug = os.environ.get('FLASK_DEBUG', 'false').lower() == 'true'
-    app.run(host='0.0.0.0', port=port, debug=debug)
+    if debug or find_spec('gunicorn') is None:
+        # 除錯模式或無 gunicorn (如 Windows) 時使用 Werkzeug 開發伺服器
+        port = int(os.environ.get('PORT', 5000))
+        app.run(host='0.0.0.0', port=port, debug=debug, threaded=True)
+    else:
+        run_gunicorn()
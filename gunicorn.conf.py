@@ -0,0 +1,14 @@
+"""
+gunicorn 設定 (gunicorn 啟動時自動讀取目前目錄下的本檔)
+SQLite 查詢期間會釋放 GIL，以 gthread worker 讓同一程序內的多個請求重疊資料庫 I/O
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+# 執行緒數預設與 app.py 的資料庫連線池大小 (DB_POOL_SIZE) 相同，每個執行緒都有閒置連線可借
+threads = int(os.environ.get('GUNICORN_THREADS', os.environ.get('DB_POOL_SIZE', '16')))
+keepalive = 5
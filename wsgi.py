@@ -0,0 +1,9 @@
+#!/usr/bin/env python3
+"""
+VE-System WSGI 進入點
+gunicorn wsgi:application (設定見 gunicorn.conf.py)
+"""
+
+from app import app
+
+application = app